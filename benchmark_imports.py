@@ -0,0 +1,68 @@
+"""
+Measures the cold start time of a scraping worker.
+
+Each measurement runs in a fresh interpreter so nothing is already cached in
+sys.modules. For an aiohttp only run the time is split into importing
+processors and loading the backends that run actually needs (aiohttp, bs4,
+lxml and fake_headers). The benchmark fails if any of them are not installed.
+
+Usage:
+    python benchmark_imports.py [runs]
+"""
+import subprocess
+import statistics
+import json
+import sys
+import os
+
+
+HEAVY_MODULES = ["playwright", "aiohttp", "bs4", "lxml", "fake_headers"]
+AIOHTTP_RUN_MODULES = ["aiohttp", "bs4", "lxml", "fake_headers"]
+
+CHILD_SCRIPT = """
+import time, sys, json
+start = time.perf_counter()
+import processors
+imported = time.perf_counter()
+loaded_on_import = [name for name in {heavy} if name in sys.modules]
+for name in {backends}:
+    __import__(name)
+backends = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "aiohttp_run": backends - start,
+    "loaded_on_import": loaded_on_import,
+    "playwright_loaded": "playwright" in sys.modules,
+}}))
+"""
+
+
+def run_once() -> dict:
+    # Run the import in a fresh interpreter so nothing is cached
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT.format(heavy=HEAVY_MODULES, backends=AIOHTTP_RUN_MODULES)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        # Most likely one of the backends is not installed
+        sys.exit(f"Benchmark failed:\n{result.stderr}")
+    return json.loads(result.stdout)
+
+
+def main(runs: int = 10) -> None:
+    results = [run_once() for _ in range(runs)]
+
+    import_times = [result["import"] * 1000 for result in results]
+    aiohttp_run_times = [result["aiohttp_run"] * 1000 for result in results]
+
+    print(f"Runs: {runs}")
+    print(f"import processors:      median {statistics.median(import_times):.2f} ms, max {max(import_times):.2f} ms")
+    print(f"aiohttp only cold start: median {statistics.median(aiohttp_run_times):.2f} ms, max {max(aiohttp_run_times):.2f} ms")
+    print(f"Heavy modules loaded on import: {results[0]['loaded_on_import'] or 'none'}")
+    print(f"Playwright loaded for aiohttp run: {results[0]['playwright_loaded']}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
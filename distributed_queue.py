@@ -0,0 +1,442 @@
+from python_logging.logger import logger
+from processors import process_batch, collect_results
+
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+from collections import defaultdict
+
+import asyncio
+import sqlite3
+import threading
+import json
+import time
+import uuid
+
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class Broker(ABC):
+    """
+    The interface every broker has to implement. A broker stores the url tasks
+    created by the Coordinator, hands them out to Workers as leases and stores
+    the results pushed back by the Workers.
+
+    Tasks are grouped into shards (one shard per domain). A shard belongs to a
+    single worker until all of its tasks are finished or the worker's lease on it
+    expires, and only one task of a shard is leased at a time. This keeps the
+    politeness of the requests to a website within a single node.
+    """
+
+    @abstractmethod
+    def push_tasks(self, tasks: list[tuple[str, list[str]]]) -> list[str]:
+        """
+        Add tasks to the broker, each task is a tuple of (shard, urls).
+        Returns the ids of the tasks that were added.
+        """
+
+
+    @abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_tasks: int = 1) -> list[tuple[str, list[str]]]:
+        """
+        Lease up to max_tasks tasks, each from a different shard, to a worker.
+        Returns a list of (task_id, urls), which is empty if there is no task
+        that can be leased right now.
+        """
+
+
+    @abstractmethod
+    def complete(self, task_id: str, worker_id: str, results: list) -> bool:
+        """
+        Store the results of a task. Returns False if the worker no longer
+        holds the lease for the task (e.g. it timed out and was re-issued).
+        """
+
+
+    @abstractmethod
+    def fail(self, task_id: str, worker_id: str) -> bool:
+        """
+        Release a task the worker could not finish so it can be retried. A task
+        that has been attempted max_attempts times is marked as failed instead.
+        Returns False if the worker no longer holds the lease for the task.
+        """
+
+
+    @abstractmethod
+    def results(self) -> list[tuple[list[str], list]]:
+        """
+        Return (urls, results) of every finished task, a failed task has no results
+        """
+
+
+    @abstractmethod
+    def remaining(self) -> int:
+        """
+        Return the number of tasks that have not been completed or failed
+        """
+
+
+class SQLiteBroker(Broker):
+    """
+    A pure python broker backed by SQLite. Use the default ":memory:" database
+    to run the coordinator and workers in a single process (e.g. for tests), or a
+    file path to share the broker between processes on the same machine.
+    """
+
+    def __init__(
+            self,
+            database: str = ":memory:",
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+            clock = time.time
+        ) -> None:
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database, check_same_thread=False, isolation_level=None)
+        self.__create_tables()
+
+
+    def __create_tables(self):
+        with self.lock:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    shard TEXT NOT NULL,
+                    urls TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    results TEXT
+                )
+            """)
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    shard TEXT PRIMARY KEY,
+                    worker_id TEXT,
+                    lease_expires REAL,
+                    lease_seconds REAL
+                )
+            """)
+
+
+    def __transaction(self, function, *args):
+        # Lock the database so two workers cannot lease the same task or shard
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(*args)
+                self.connection.execute("COMMIT")
+                return result
+            except:
+                self.connection.execute("ROLLBACK")
+                raise
+
+
+    def push_tasks(self, tasks: list[tuple[str, list[str]]]) -> list[str]:
+        return self.__transaction(self.__push_tasks, tasks)
+
+
+    def __push_tasks(self, tasks):
+        task_ids = []
+        for shard, urls in tasks:
+            task_id = uuid.uuid4().hex
+            self.connection.execute(
+                "INSERT INTO tasks (id, shard, urls) VALUES (?, ?, ?)",
+                (task_id, shard, json.dumps(urls))
+            )
+            task_ids.append(task_id)
+        return task_ids
+
+
+    def lease(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_tasks: int = 1) -> list[tuple[str, list[str]]]:
+        return self.__transaction(self.__lease, worker_id, lease_seconds, max_tasks)
+
+
+    def __lease(self, worker_id, lease_seconds, max_tasks):
+        now = self.clock()
+        self.__fail_expired(now)
+
+        # Find the first leasable task of each shard this worker may take. A task is leasable
+        # if it is pending or its lease has expired (the worker died). A shard can be taken if
+        # no other worker owns it (or their lease on it expired) and none of its tasks are
+        # currently leased. The shards this worker already owns come first.
+        rows = self.connection.execute("""
+            SELECT task.shard, MIN(task.rowid) FROM tasks AS task
+            LEFT JOIN shards ON shards.shard = task.shard
+            WHERE (task.status = 'pending' OR (task.status = 'leased' AND task.lease_expires <= :now))
+            AND (shards.worker_id IS NULL OR shards.worker_id = :worker_id OR shards.lease_expires <= :now)
+            AND NOT EXISTS (
+                SELECT 1 FROM tasks AS other
+                WHERE other.shard = task.shard
+                AND other.status = 'leased'
+                AND other.lease_expires > :now
+            )
+            GROUP BY task.shard
+            ORDER BY COALESCE(shards.worker_id = :worker_id, 0) DESC, MIN(task.rowid)
+            LIMIT :max_tasks
+        """, {"now": now, "worker_id": worker_id, "max_tasks": max_tasks}).fetchall()
+
+        tasks = []
+        for shard, rowid in rows:
+            task_id, urls = self.connection.execute(
+                "SELECT id, urls FROM tasks WHERE rowid = ?", (rowid,)
+            ).fetchone()
+            self.connection.execute(
+                "UPDATE tasks SET status = 'leased', worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker_id, now + lease_seconds, task_id)
+            )
+            self.connection.execute("""
+                INSERT INTO shards (shard, worker_id, lease_expires, lease_seconds) VALUES (?, ?, ?, ?)
+                ON CONFLICT (shard) DO UPDATE SET
+                worker_id = excluded.worker_id, lease_expires = excluded.lease_expires, lease_seconds = excluded.lease_seconds
+            """, (shard, worker_id, now + lease_seconds, lease_seconds))
+            tasks.append((task_id, json.loads(urls)))
+
+        return tasks
+
+
+    def __fail_expired(self, now):
+        # Tasks whose lease expired on their last attempt will not be re-issued
+        self.connection.execute(
+            "UPDATE tasks SET status = 'failed' WHERE status = 'leased' AND lease_expires <= ? AND attempts >= ?",
+            (now, self.max_attempts)
+        )
+
+
+    def complete(self, task_id: str, worker_id: str, results: list) -> bool:
+        # Serialise the results before locking so an unserialisable result does not leave a transaction open
+        results = json.dumps(results)
+        return self.__transaction(self.__finish, task_id, worker_id, "done", results)
+
+
+    def fail(self, task_id: str, worker_id: str) -> bool:
+        return self.__transaction(self.__finish, task_id, worker_id, "pending", None)
+
+
+    def __finish(self, task_id, worker_id, status, results):
+        # A task released to be retried is failed instead once it has used all of its attempts
+        cursor = self.connection.execute("""
+            UPDATE tasks SET
+            status = CASE WHEN :status = 'pending' AND attempts >= :max_attempts THEN 'failed' ELSE :status END,
+            results = :results, lease_expires = NULL
+            WHERE id = :task_id AND status = 'leased' AND worker_id = :worker_id
+        """, {
+            "status": status, "max_attempts": self.max_attempts, "results": results,
+            "task_id": task_id, "worker_id": worker_id
+        })
+        if cursor.rowcount != 1:
+            return False
+
+        (shard,) = self.connection.execute("SELECT shard FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        (unfinished,) = self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE shard = ? AND status IN ('pending', 'leased')", (shard,)
+        ).fetchone()
+
+        if unfinished:
+            # Keep the shard with this worker so its delay between batches is respected
+            self.connection.execute(
+                "UPDATE shards SET lease_expires = ? + lease_seconds WHERE shard = ? AND worker_id = ?",
+                (self.clock(), shard, worker_id)
+            )
+        else:
+            # Release the shard so any worker can take tasks pushed for it later
+            self.connection.execute(
+                "UPDATE shards SET worker_id = NULL, lease_expires = NULL WHERE shard = ? AND worker_id = ?",
+                (shard, worker_id)
+            )
+
+        return True
+
+
+    def results(self) -> list[tuple[list[str], list]]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT urls, results FROM tasks WHERE status IN ('done', 'failed') ORDER BY rowid"
+            ).fetchall()
+        return [(json.loads(urls), json.loads(results) if results else []) for urls, results in rows]
+
+
+    def remaining(self) -> int:
+        return self.__transaction(self.__remaining)
+
+
+    def __remaining(self):
+        self.__fail_expired(self.clock())
+        (count,) = self.connection.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status IN ('pending', 'leased')"
+        ).fetchone()
+        return count
+
+
+class Coordinator:
+    """
+    Shards the urls by domain, splits each shard into tasks and pushes the
+    tasks to the broker for the workers to lease.
+    """
+
+    def __init__(self, broker: Broker, urls_per_task: int = 1) -> None:
+        """
+        Args:
+            broker (Broker): The broker the tasks are pushed to
+            urls_per_task (int, optional): The number of urls in each task, which is the most requests
+                sent to a website at the same time. Default is 1.
+        """
+        self.broker = broker
+        self.urls_per_task = urls_per_task
+
+
+    def submit(self, urls: list[str]) -> list[str]:
+        """
+        Push the urls to the broker. Returns the ids of the tasks created.
+        """
+        return self.broker.push_tasks(self.__create_shard_tasks(urls))
+
+
+    def __create_shard_tasks(self, urls: list[str]) -> list[tuple[str, list[str]]]:
+        # Group the urls by domain, each domain is its own shard
+        shards = defaultdict(list)
+        for url in urls or []:
+            shards[urlparse(url).netloc].append(url)
+
+        # Split each shard into tasks of urls_per_task, interleaving the shards so
+        # the tasks are handed out across the websites
+        most_urls = max(map(len, shards.values()), default=0)
+        return [
+            (shard, shard_urls[start:start + self.urls_per_task])
+            for start in range(0, most_urls, self.urls_per_task)
+            for shard, shard_urls in shards.items()
+            if shard_urls[start:start + self.urls_per_task]
+        ]
+
+
+    def is_finished(self) -> bool:
+        return self.broker.remaining() == 0
+
+
+    def results(self) -> dict:
+        """
+        Collect the results pushed by the workers in the same format as process_batches
+        """
+        results = {}
+        for urls, task_results in self.broker.results():
+            collect_results(urls, task_results, results)
+        return results
+
+
+    async def wait(self, poll_seconds: float = 1) -> dict:
+        """
+        Wait until every task has been completed or failed then return the results
+        """
+        while not self.is_finished():
+            await asyncio.sleep(poll_seconds)
+        return self.results()
+
+
+class Worker:
+    """
+    Leases tasks from the broker, requests and scrapes their urls as a single
+    batch and pushes the results back to the broker.
+    """
+
+    def __init__(
+            self,
+            broker: Broker,
+            scraping_data: dict,
+            aiohttp_urls: bool = False,
+            playwright_urls: bool = False,
+            batch_size: int = 8,
+            worker_id: str = None,
+            lease_seconds: float = DEFAULT_LEASE_SECONDS,
+            batch_delay_seconds: float = 10,
+            poll_seconds: float = 1
+        ) -> None:
+        self.broker = broker
+        self.scraping_data = scraping_data
+        self.aiohttp_urls = aiohttp_urls
+        self.playwright_urls = playwright_urls
+        self.batch_size = batch_size
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self.batch_delay_seconds = batch_delay_seconds
+        self.poll_seconds = poll_seconds
+
+
+    async def run(self, stop_when_empty: bool = True) -> int:
+        """
+        Process tasks from the broker until there are none left.
+        If stop_when_empty is False the worker keeps polling the broker for new tasks.
+
+        Returns:
+            int: The number of tasks completed by this worker
+        """
+        completed = 0
+        while True:
+            # Each task comes from a different shard, so the batch is spread across websites
+            tasks = self.broker.lease(self.worker_id, self.lease_seconds, self.batch_size)
+
+            if not tasks:
+                if stop_when_empty and self.broker.remaining() == 0:
+                    return completed
+                # Other workers hold the remaining shards, wait in case their leases expire
+                await asyncio.sleep(self.poll_seconds)
+                continue
+
+            completed += await self.run_tasks(tasks)
+
+            await asyncio.sleep(self.batch_delay_seconds)
+
+
+    async def run_tasks(self, tasks: list[tuple[str, list[str]]]) -> int:
+        """
+        Request and scrape the urls of the tasks as one batch and push the results of each task
+
+        Returns:
+            int: The number of tasks completed
+        """
+        batch_urls = [url for _, urls in tasks for url in urls]
+        try:
+            batch_results = await process_batch(
+                batch_urls, self.scraping_data, self.aiohttp_urls, self.playwright_urls
+            )
+        except Exception as error:
+            # Release the tasks so they are retried, or failed after too many attempts
+            logger.error("Error", error=error)
+            for task_id, _ in tasks:
+                self.fail(task_id)
+            return 0
+
+        completed = 0
+        start = 0
+        for task_id, urls in tasks:
+            task_results = batch_results[start:start + len(urls)]
+            start += len(urls)
+            try:
+                if self.broker.complete(task_id, self.worker_id, task_results):
+                    completed += 1
+                else:
+                    logger.warning(f"Lease for task ({task_id}) expired before the results were pushed")
+            except Exception as error:
+                logger.error("Error", error=error)
+                self.fail(task_id)
+
+        return completed
+
+
+    def fail(self, task_id: str) -> None:
+        """
+        Release a task so it is retried. If the broker cannot be reached the error is
+        logged and the task is re-issued when its lease expires.
+        """
+        try:
+            self.broker.fail(task_id, self.worker_id)
+        except Exception as error:
+            logger.error(f"Could not release task ({task_id})", error=error)
+
+
+def run_worker(broker: Broker, scraping_data: dict, **kwargs) -> int:
+    """
+    Run a single worker until the broker has no tasks left
+    """
+    return asyncio.run(Worker(broker, scraping_data, **kwargs).run())
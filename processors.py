@@ -1,19 +1,36 @@
+from __future__ import annotations
+
 from python_logging.logger import logger
+from profiler import profiler
 from batched_queue import BatchedQueue
 from web_request import aiohttp_fetch, playwright_fetch
 from exceptions import InvalidResponseType
 
-from playwright.async_api import async_playwright
+from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 from collections import defaultdict
-from bs4 import BeautifulSoup, element
 
 import concurrent.futures
 import asyncio
-import aiohttp
 import copy
 
-logger.config(file="webscraper.log", ptt=True, clear_log=True, colours=True)
+if TYPE_CHECKING:
+    # The fetcher and parser backends are heavy to import, so they are only
+    # loaded inside the functions that use them (see aiohttp_request,
+    # playwright_request and scrape)
+    from bs4 import BeautifulSoup
+
+
+def setup_logging(file: str = "webscraper.log", clear_log: bool = True) -> None:
+    """
+    Configure the logger for a scraping run. This is not done on import so that
+    importing this module has no side effects (such as truncating the log file).
+
+    Args:
+        file (str, optional): The file the logs are written to. Default is "webscraper.log".
+        clear_log (bool, optional): Erase the log file before running. Default is True.
+    """
+    logger.config(file=file, ptt=True, clear_log=clear_log, colours=True)
 
 
 def run_scraping_session(
@@ -23,7 +40,12 @@ def run_scraping_session(
         aiohttp_urls: bool = False,
         playwright_urls: bool = False
     ) -> list:
+    """
+    Scrape the urls on a single node.
 
+    The logger is not configured on import, until setup_logging is called logs are
+    printed to the terminal and appended to webscraper.log (it is no longer cleared).
+    """
     try:
 
         urls = process_urls(urls)
@@ -91,28 +113,11 @@ async def process_batches(queue: BatchedQueue, batch_delay_seconds=10):
             
             batch_urls = queue.pop()
 
-            if queue.aiohttp_urls:
-                # If the urls in the queue need to be requested using aiohttp then run
-                # the function 'aiohttp_request'
-                responses = await aiohttp_request(batch_urls)
-            elif queue.playwright_urls:
-                # If the urls in the queue need to be requested using playwright then run
-                # the function 'playwright_request'
-                responses = await playwright_request(batch_urls, queue)
-            
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                # Use ThreadPoolExecutor to parallelize the CPU-bound scraping task
-                batch_results = list(executor.map(lambda args: scrape(queue.scraping_data, *args), zip(responses, batch_urls)))
-
-            for url in batch_urls:
-                # Collect the results for each url in the batch_results
-                website_name = get_website_name(url)
-                results[website_name] = []
-                for result_website_name, result in [result for result in batch_results if result is not None]:
-                    if website_name == result_website_name:
-                        # Match the current url to the batch_result url
-                        # and then append the result to results
-                        results[website_name].append(result)
+            batch_results = await process_batch(
+                batch_urls, queue.scraping_data, queue.aiohttp_urls, queue.playwright_urls
+            )
+
+            collect_results(batch_urls, batch_results, results)
 
             await asyncio.sleep(batch_delay_seconds)
 
@@ -125,28 +130,96 @@ async def process_batches(queue: BatchedQueue, batch_delay_seconds=10):
     return results
 
 
+def collect_results(batch_urls: list, batch_results: list, results: dict) -> dict:
+    """
+    Adds the results of a batch to the results of the previous batches.
+    This is used by both process_batches and the distributed Coordinator.
+
+    Args:
+        batch_urls (list): A list of urls from the batch
+        batch_results (list): The result of the 'scrape' function for each url
+        results (dict): The results collected so far, {website_name: [scraped_data, ...]}
+
+    Returns:
+        dict: The results with the batch results added
+    """
+    for url in batch_urls:
+        # Every website in the batch has an entry, even if none of its urls were scraped
+        results.setdefault(get_website_name(url), [])
+
+    for result in batch_results:
+        if result is None:
+            continue
+        website_name, scraped_data = result
+        if isinstance(website_name, int):
+            # This is a response code, (status, url)
+            continue
+        results[website_name].append(scraped_data)
+
+    return results
+
+
+async def process_batch(
+        batch_urls: list,
+        scraping_data: dict,
+        aiohttp_urls: bool = False,
+        playwright_urls: bool = False
+    ) -> list:
+    """
+    Sends requests to a single batch of urls and scrapes the responses.
+    This is used by both process_batches and the distributed workers.
+
+    Args:
+        batch_urls (list): A list of urls from the current batch
+        scraping_data (dict): The scraping data for each website
+        aiohttp_urls (bool, optional): Request the urls using aiohttp. Default is False.
+        playwright_urls (bool, optional): Request the urls using playwright. Default is False.
+
+    Returns:
+        List: A list containing the result of the 'scrape' function for each url
+    """
+    responses = []
+    with profiler.span("fetch", urls=len(batch_urls)):
+        if aiohttp_urls:
+            # If the urls in the queue need to be requested using aiohttp then run
+            # the function 'aiohttp_request'
+            responses = await aiohttp_request(batch_urls)
+        elif playwright_urls:
+            # If the urls in the queue need to be requested using playwright then run
+            # the function 'playwright_request'
+            responses = await playwright_request(batch_urls, scraping_data)
+
+    with profiler.span("scrape batch", urls=len(batch_urls)), concurrent.futures.ThreadPoolExecutor() as executor:
+        # Use ThreadPoolExecutor to parallelize the CPU-bound scraping task
+        return list(executor.map(lambda args: scrape(scraping_data, *args), zip(responses, batch_urls)))
+
+
 async def aiohttp_request(batch_urls: list):
     """
     Create an aiohttp session and send requests asynchronously to each url
     """
+    import aiohttp
+
     async with aiohttp.ClientSession() as session:
         tasks = [aiohttp_fetch(url, session) for url in batch_urls]
         # Use asyncio.gather to wait for all asynchronous requests to complete
         return await asyncio.gather(*tasks)
     
 
-async def playwright_request(batch_urls: list, queue: BatchedQueue):
+async def playwright_request(batch_urls: list, scraping_data: dict):
     """
     Create a playwright session and create a browser and context
     Create a page for each url and get that page to send a request to the url
 
     Args: 
         batch_urls (list): A list of urls from the current batch
-        queue: (BatchedQueue): An instance of BatchedQueue containing URLs to be processed. 
+        scraping_data (dict): The scraping data for each website
     
     Returns:
         List: A list of responses collected from each request
     """
+    from playwright.async_api import async_playwright
+
     try:
         # Initialise playwright
         async with async_playwright() as playwright:
@@ -160,7 +233,7 @@ async def playwright_request(batch_urls: list, queue: BatchedQueue):
                     playwright_fetch(
                         url,                                                 # url
                         await context.new_page(),                            # page
-                        queue.scraping_data[get_website_name(url)]["xpath"]  # xpath
+                        scraping_data[get_website_name(url)]["xpath"]        # xpath
                     ) for url in batch_urls
                 ]
 
@@ -200,11 +273,16 @@ def scrape(scraping_data: dict, *args: tuple):
 
         # If the response is in html then scrape the data using the html function
         if response_type == "html":
-            html = BeautifulSoup(response, "lxml")
-            tag_info = scraping_data[website_name]["data"]
+            from bs4 import BeautifulSoup
 
-            for item_name, item_info in tag_info.items():
-                scraped_data[item_name.replace("multiple ", "")] = scrape_html(html, item_name, item_info)
+            with profiler.site(website_name):
+                with profiler.span("BeautifulSoup"):
+                    html = BeautifulSoup(response, "lxml")
+                tag_info = scraping_data[website_name]["data"]
+
+                for item_name, item_info in tag_info.items():
+                    with profiler.span(item_name, category="item"):
+                        scraped_data[item_name.replace("multiple ", "")] = scrape_html(html, item_name, item_info)
         
         elif response_type == "json":
             pass
@@ -262,7 +340,8 @@ def handle_multiple_html_tags(html, scraping_data: dict):
             # This is the dictionary that contains the current tag information
             tag_data = {}
             # Make a deep copy of the scraping data each loop as it gets modified
-            scraping_data_copy = copy.deepcopy(scraping_data)
+            with profiler.span("deepcopy"):
+                scraping_data_copy = copy.deepcopy(scraping_data)
             
             for item_name, item_data in scraping_data_copy.items():
                 # Loop through the scraping data for each item to be scraped in the tag
@@ -285,7 +364,8 @@ def handle_single_html_tag(html: BeautifulSoup, scraping_data: dict, tag_info: d
 
         if attribute is None:
             # If attribute is None, then we will scrape for more data
-            scraping_data_copy = copy.deepcopy(scraping_data)
+            with profiler.span("deepcopy"):
+                scraping_data_copy = copy.deepcopy(scraping_data)
             for item_name, item_data in scraping_data_copy.items():
                 scraped_data[item_name] = scrape_html(html, item_name, item_data)
 
@@ -310,14 +390,19 @@ def scrape_html_tag(html: BeautifulSoup, tag_info: dict) -> tuple[BeautifulSoup,
 
         # Get the number of tags to scrape for
         num_items = tag_info.get("max", None)
+
+        # The selector is used to name the timing span when profiling
+        selector = f'{tag}[{attr_name}="{attr_value}"]' if profiler.enabled else None
         
         if num_items is None:
             # Scrape for only a single item
-            return (html.find(name=tag, attrs=attrs), False)
+            with profiler.span(selector, category="selector", method="find"):
+                return (html.find(name=tag, attrs=attrs), False)
             
         else:
             # Scrape for multiple items
-            return (html.find_all(name=tag, attrs=attrs)[:num_items], True)
+            with profiler.span(selector, category="selector", method="find_all"):
+                return (html.find_all(name=tag, attrs=attrs)[:num_items], True)
 
     except:
         pass
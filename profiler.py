@@ -0,0 +1,206 @@
+from python_logging.logger import logger
+
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import threading
+import sys
+import json
+import time
+import os
+
+
+# From Python 3.12 cProfile profiles every thread, not just the one it was enabled in
+CPROFILE_IS_GLOBAL = sys.version_info >= (3, 12)
+
+
+class ProfileClass(object):
+    def __init__(self):
+        """
+        Profiling is disabled until config is called with enabled=True
+        """
+        self.enabled = False
+        self.cprofile = False
+        self.output_dir = "profiles"
+
+        self.lock = threading.Lock()
+        self.cprofile_lock = threading.Lock()
+        self.local = threading.local()
+        self.__reset()
+
+
+    def config(
+            self,
+            enabled: bool = True,
+            cprofile: bool = False,
+            output_dir: str = "profiles"
+            ):
+        """
+        Configure the profiler with some settings
+
+        enabled: record a timing span for each pipeline stage and each scraping_data item
+        cprofile: also sample each site with cProfile, written to output_dir/<website_name>.prof
+        output_dir: the directory the trace, summary and cProfile files are written to
+        """
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.output_dir = output_dir
+        self.__reset()
+
+        # Time each log, including the logger finding the caller
+        logger.timer = self.__log_timer if enabled else None
+
+
+    def __log_timer(self, log_type):
+        return self.span("logging", log_type=log_type)
+
+
+    def __reset(self):
+        self.start = time.perf_counter_ns()
+        self.events = []
+        # {website_name: {(category, name): [count, total_us]}}
+        self.totals = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+        self.site_profiles = {}
+
+
+    def span(self, name: str, category: str = "stage", **args):
+        """
+        Time the code inside the with block as a single trace event
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self.__span(name, category, args)
+
+
+    @contextmanager
+    def __span(self, name, category, args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.__record(name, category, start, end, args)
+
+
+    def __record(self, name, category, start, end, args):
+        duration = (end - start) // 1000
+        website_name = getattr(self.local, "website_name", None)
+
+        if website_name is not None:
+            args = {"website": website_name, **args}
+
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.start) // 1000,
+            "dur": duration,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args
+        })
+
+        with self.lock:
+            total = self.totals[website_name or "-"][(category, name)]
+            total[0] += 1
+            total[1] += duration
+
+
+    def site(self, website_name: str):
+        """
+        Mark the code inside the with block as scraping website_name, so every
+        span inside it is attributed to that site. If cprofile is enabled the
+        block is also profiled with cProfile.
+        """
+        if not self.enabled:
+            return nullcontext()
+        if self.cprofile and CPROFILE_IS_GLOBAL:
+            # The profiler would also record the pages scraped in other threads, so
+            # only one page is scraped at a time while profiling
+            return self.__locked_site(website_name)
+        return self.__site(website_name)
+
+
+    @contextmanager
+    def __locked_site(self, website_name):
+        with self.cprofile_lock, self.__site(website_name):
+            yield
+
+
+    @contextmanager
+    def __site(self, website_name):
+        self.local.website_name = website_name
+        profile = None
+        if self.cprofile:
+            import cProfile
+
+            # Each page gets its own profiler, which only records the thread it is
+            # enabled in (or every thread on Python 3.12+, see site)
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool is already active
+                profile = None
+
+        try:
+            with self.span(website_name, category="site"):
+                yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                import pstats
+
+                with self.lock:
+                    if website_name in self.site_profiles:
+                        self.site_profiles[website_name].add(profile)
+                    else:
+                        self.site_profiles[website_name] = pstats.Stats(profile)
+            self.local.website_name = None
+
+
+    def summary(self, top: int = 10) -> dict:
+        """
+        Returns the most costly selectors and the time spent in each stage for each site
+
+        Returns:
+            dict: {website_name: {"selectors": [...], "stages": [...]}}, times are in milliseconds
+        """
+        def ordered(totals, category):
+            items = [
+                {"name": name, "count": count, "total_ms": total / 1000, "mean_ms": total / count / 1000}
+                for (item_category, name), (count, total) in totals.items()
+                if item_category == category
+            ]
+            return sorted(items, key=lambda item: item["total_ms"], reverse=True)
+
+        with self.lock:
+            return {
+                website_name: {
+                    "selectors": ordered(totals, "selector")[:top],
+                    "items": ordered(totals, "item")[:top],
+                    "stages": ordered(totals, "stage")
+                }
+                for website_name, totals in self.totals.items()
+            }
+
+
+    def write(self, trace_file: str = "trace.json", summary_file: str = "summary.json", top: int = 10):
+        """
+        Write the Chrome trace (can be opened in chrome://tracing, Perfetto or speedscope),
+        the per site summary and the cProfile stats of each site to output_dir
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        with open(os.path.join(self.output_dir, trace_file), "w") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+        with open(os.path.join(self.output_dir, summary_file), "w") as file:
+            json.dump(self.summary(top), file, indent=4)
+
+        with self.lock:
+            for website_name, stats in self.site_profiles.items():
+                stats.dump_stats(os.path.join(self.output_dir, f"{website_name}.prof"))
+
+
+profiler = ProfileClass()
@@ -1,6 +1,7 @@
 from datetime import datetime
 from inspect import getframeinfo, stack
 from datetime import datetime
+from contextlib import nullcontext
 from .colours import colour
 import inspect
 
@@ -14,6 +15,18 @@ class LogClass(object):
         self.top = f"\n{colour.BOLD}{colour.WHITE}-------------------------------------------------------------------------\n"
         self.bottom = f"{colour.BOLD}{colour.WHITE}-------------------------------------------------------------------------"
 
+        # Defaults so the logger can be used before config is called, these match
+        # what the webscraper used before config was moved out of import (without
+        # clearing the log file)
+        self.file = "webscraper.log"
+        self.ptt = True
+        self.date_fmt = "%H:%M:%S %d-%m-%Y"
+        self.keep_only_1000_logs = False
+
+        # A function taking the log type and returning a context manager that
+        # times each log, including finding the caller (used by the profiler)
+        self.timer = None
+
 
     @staticmethod
     def staticmethod():
@@ -77,6 +90,15 @@ class LogClass(object):
             file.truncate()
 
     
+    def __time(self, log_type):
+        """
+        Time a log with the timer hook, if one is set
+        """
+        if self.timer is None:
+            return nullcontext()
+        return self.timer(log_type)
+
+
     def __main_log(self, caller, msg, items, log_type, log_colour, error):
         now = datetime.today()
         time = now.strftime(self.date_fmt)
@@ -157,56 +179,63 @@ class LogClass(object):
         """
         Custom log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type=log_type, log_colour=log_colour, error=error)     
+        with self.__time(log_type):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type=log_type, log_colour=log_colour, error=error)     
 
 
     def info(self, msg, items = [], error = None):
         """
         Info Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="INFO", log_colour=colour.CYAN, error=error)
+        with self.__time("INFO"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="INFO", log_colour=colour.CYAN, error=error)
 
 
     def debug(self, msg, items = [], error = None):
         """
         Debug Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="DEBUG", log_colour=colour.DARKCYAN, error=error)
+        with self.__time("DEBUG"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="DEBUG", log_colour=colour.DARKCYAN, error=error)
 
 
     def warning(self, msg, items = [], error = None):
         """
         Warning Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="WARNING", log_colour=colour.YELLOW, error=error)
+        with self.__time("WARNING"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="WARNING", log_colour=colour.YELLOW, error=error)
 
 
     def error(self, msg, items = [], error = None):
         """
         Error Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="ERROR", log_colour=colour.RED, error=error)
+        with self.__time("ERROR"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="ERROR", log_colour=colour.RED, error=error)
 
 
     def critical(self, msg, items = [], error = None):
         """
         Critical Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="CRITICAL", log_colour=colour.MAGENTA, error=error)
+        with self.__time("CRITICAL"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="CRITICAL", log_colour=colour.MAGENTA, error=error)
 
 
     def success(self, msg, items = [], error = None):
         """
         Success Log
         """
-        caller = getframeinfo(stack()[1][0])
-        self.__main_log(caller=caller, msg=msg, items=items, log_type="SUCCESS", log_colour=colour.GREEN, error=error)
+        with self.__time("SUCCESS"):
+            caller = getframeinfo(stack()[1][0])
+            self.__main_log(caller=caller, msg=msg, items=items, log_type="SUCCESS", log_colour=colour.GREEN, error=error)
 
 
 logger = LogClass()
\ No newline at end of file
@@ -0,0 +1,186 @@
+import distributed_queue
+from distributed_queue import Broker, SQLiteBroker, Coordinator, Worker
+from batched_queue import BatchedQueue
+import processors
+
+import asyncio
+import sqlite3
+import pytest
+
+
+class Clock:
+    def __init__(self, now: float = 1000) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def broker(clock):
+    return SQLiteBroker(max_attempts=2, clock=clock)
+
+
+def test_broker_is_abstract():
+    class PartialBroker(Broker):
+        def push_tasks(self, tasks):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialBroker()
+
+
+def test_coordinator_shards_by_domain(broker):
+    urls = ["https://www.a.com/1", "https://www.a.com/2", "https://www.b.com/1"]
+    assert len(Coordinator(broker, urls_per_task=1).submit(urls)) == 3
+    assert broker.remaining() == 3
+
+    # One task from each shard can be leased at a time
+    tasks = broker.lease("w1", max_tasks=8)
+    assert sorted(urls for _, urls in tasks) == [["https://www.a.com/1"], ["https://www.b.com/1"]]
+
+
+def test_shard_stays_with_worker_until_drained(broker):
+    Coordinator(broker).submit(["https://www.a.com/1", "https://www.a.com/2"])
+
+    [(task_id, _)] = broker.lease("w1", lease_seconds=60)
+    assert broker.lease("w2", lease_seconds=60) == []
+
+    # w1 is still waiting for its batch delay, w2 cannot take the next task of the shard
+    assert broker.complete(task_id, "w1", [])
+    assert broker.lease("w2", lease_seconds=60) == []
+
+    [(task_id, urls)] = broker.lease("w1", lease_seconds=60)
+    assert urls == ["https://www.a.com/2"]
+    assert broker.complete(task_id, "w1", [])
+    assert broker.remaining() == 0
+
+    # The drained shard is released for tasks pushed later
+    Coordinator(broker).submit(["https://www.a.com/3"])
+    assert len(broker.lease("w2", lease_seconds=60)) == 1
+
+
+def test_expired_lease_is_reissued_and_stale_complete_rejected(broker, clock):
+    Coordinator(broker).submit(["https://www.a.com/1"])
+
+    [(task_id, _)] = broker.lease("w1", lease_seconds=60)
+    clock.now += 61
+
+    assert broker.lease("w2", lease_seconds=60) == [(task_id, ["https://www.a.com/1"])]
+    assert not broker.complete(task_id, "w1", [["a", {}]])
+    assert broker.complete(task_id, "w2", [["a", {"item": "w2"}]])
+    assert broker.results() == [(["https://www.a.com/1"], [["a", {"item": "w2"}]])]
+
+
+def test_task_fails_after_max_attempts(broker):
+    Coordinator(broker).submit(["https://www.a.com/1"])
+
+    # The first attempt is released to be retried
+    [(task_id, _)] = broker.lease("w1")
+    assert broker.fail(task_id, "w1")
+    assert broker.remaining() == 1
+
+    # The second attempt fails the task
+    [(task_id, _)] = broker.lease("w1")
+    assert broker.fail(task_id, "w1")
+    assert broker.remaining() == 0
+    assert broker.lease("w1") == []
+
+
+def test_task_fails_when_last_lease_expires(broker, clock):
+    Coordinator(broker).submit(["https://www.a.com/1"])
+
+    broker.lease("w1", lease_seconds=60)
+    clock.now += 61
+    assert len(broker.lease("w2", lease_seconds=60)) == 1
+    clock.now += 61
+    assert broker.remaining() == 0
+    assert broker.lease("w3", lease_seconds=60) == []
+
+
+def test_coordinator_results_format(broker):
+    coordinator = Coordinator(broker)
+    coordinator.submit(["https://www.a.com/1", "https://www.a.com/2", "https://www.b.com/1"])
+
+    while broker.remaining():
+        for task_id, urls in broker.lease("w1", max_tasks=8):
+            results = [[url.split(".")[1], {"url": url}] for url in urls]
+            if urls == ["https://www.b.com/1"]:
+                # A response code result is not included
+                results = [[404, urls[0]]]
+            broker.complete(task_id, "w1", results)
+
+    assert coordinator.results() == {
+        "a": [{"url": "https://www.a.com/1"}, {"url": "https://www.a.com/2"}],
+        "b": []
+    }
+
+
+def test_coordinator_results_match_process_batches(broker, monkeypatch):
+    async def batch(batch_urls, *args):
+        return [(url.split(".")[1], {"url": url}) for url in batch_urls]
+
+    monkeypatch.setattr(distributed_queue, "process_batch", batch)
+    monkeypatch.setattr(processors, "process_batch", batch)
+    urls = ["https://www.a.com/1", "https://www.b.com/1", "https://www.a.com/2", "https://www.a.com/3"]
+
+    # Results from earlier batches of the same website are kept
+    single_node = asyncio.run(processors.process_batches(BatchedQueue(urls, 2, {}, aiohttp_urls=True), batch_delay_seconds=0))
+    assert single_node["a"] == [{"url": "https://www.a.com/1"}, {"url": "https://www.a.com/2"}, {"url": "https://www.a.com/3"}]
+
+    coordinator = Coordinator(broker)
+    coordinator.submit(urls)
+    worker = Worker(broker, {}, aiohttp_urls=True, worker_id="w1", batch_delay_seconds=0, poll_seconds=0)
+    asyncio.run(worker.run())
+
+    assert {website_name: sorted(results, key=str) for website_name, results in coordinator.results().items()} == single_node
+
+
+def test_worker_survives_broker_errors_when_releasing(broker, monkeypatch):
+    async def failing_batch(*args):
+        raise ConnectionError("Cannot connect")
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(distributed_queue, "process_batch", failing_batch)
+    monkeypatch.setattr(distributed_queue.logger, "error", lambda *args, **kwargs: None)
+    monkeypatch.setattr(broker, "fail", locked)
+    Coordinator(broker).submit(["https://www.a.com/1"])
+
+    worker = Worker(broker, {}, aiohttp_urls=True, worker_id="w1", batch_delay_seconds=0)
+    assert asyncio.run(worker.run_tasks(broker.lease("w1"))) == 0
+
+
+def test_worker_finishes_when_tasks_keep_failing(broker, monkeypatch):
+    async def failing_batch(*args):
+        raise ConnectionError("Cannot connect")
+
+    monkeypatch.setattr(distributed_queue, "process_batch", failing_batch)
+    monkeypatch.setattr(distributed_queue.logger, "error", lambda *args, **kwargs: None)
+    Coordinator(broker).submit(["https://www.a.com/1"])
+
+    worker = Worker(broker, {}, aiohttp_urls=True, worker_id="w1", batch_delay_seconds=0, poll_seconds=0)
+    assert asyncio.run(worker.run()) == 0
+    assert broker.remaining() == 0
+
+
+def test_worker_pushes_results_per_task(broker, monkeypatch):
+    async def batch(batch_urls, *args):
+        return [(url.split(".")[1], {"url": url}) for url in batch_urls]
+
+    monkeypatch.setattr(distributed_queue, "process_batch", batch)
+    coordinator = Coordinator(broker)
+    coordinator.submit(["https://www.a.com/1", "https://www.b.com/1", "https://www.a.com/2"])
+
+    worker = Worker(broker, {}, aiohttp_urls=True, worker_id="w1", batch_delay_seconds=0, poll_seconds=0)
+    assert asyncio.run(worker.run()) == 3
+    assert coordinator.results() == {
+        "a": [{"url": "https://www.a.com/1"}, {"url": "https://www.a.com/2"}],
+        "b": [{"url": "https://www.b.com/1"}]
+    }
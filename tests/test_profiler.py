@@ -0,0 +1,138 @@
+import profiler as profiler_module
+from profiler import ProfileClass
+from python_logging.logger import logger
+import python_logging.logger as logger_module
+
+from contextlib import nullcontext
+import threading
+import json
+import pytest
+
+
+class Counter:
+    """
+    Replaces time.perf_counter_ns so span durations are exact
+    """
+    def __init__(self) -> None:
+        self.now = 0
+
+    def perf_counter_ns(self) -> int:
+        return self.now
+
+    def advance(self, milliseconds: float) -> None:
+        self.now += int(milliseconds * 1_000_000)
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    counter = Counter()
+    monkeypatch.setattr(profiler_module, "time", counter)
+    return counter
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = ProfileClass()
+    profiler.config(enabled=True, output_dir=str(tmp_path))
+    yield profiler
+    profiler.config(enabled=False)
+
+
+def test_disabled_records_nothing():
+    profiler = ProfileClass()
+    assert isinstance(profiler.span("find"), nullcontext)
+    assert isinstance(profiler.site("a"), nullcontext)
+    with profiler.site("a"), profiler.span("find"):
+        pass
+    assert profiler.events == []
+    assert profiler.summary() == {}
+
+
+def test_spans_are_attributed_to_site(profiler):
+    def scrape(website_name):
+        with profiler.site(website_name):
+            with profiler.span('div[class="item"]', category="selector"):
+                pass
+
+    threads = [threading.Thread(target=scrape, args=(website_name,)) for website_name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with profiler.span("fetch"):
+        pass
+
+    selectors = [event for event in profiler.events if event["cat"] == "selector"]
+    assert sorted(event["args"]["website"] for event in selectors) == ["a", "b"]
+
+    summary = profiler.summary()
+    assert summary["a"]["selectors"][0]["name"] == 'div[class="item"]'
+    assert summary["-"]["stages"][0]["name"] == "fetch"
+
+
+def test_summary_orders_selectors_and_limits_top(profiler, counter):
+    with profiler.site("a"):
+        for name, milliseconds in [("span", 1), ("div", 5), ("img", 3), ("div", 5)]:
+            with profiler.span(name, category="selector"):
+                counter.advance(milliseconds)
+
+    selectors = profiler.summary(top=2)["a"]["selectors"]
+    assert [selector["name"] for selector in selectors] == ["div", "img"]
+    assert selectors[0] == {"name": "div", "count": 2, "total_ms": 10, "mean_ms": 5}
+
+
+def test_logging_span_includes_caller_lookup(profiler, counter, tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "file", str(tmp_path / "webscraper.log"))
+    monkeypatch.setattr(logger, "ptt", False)
+
+    stack = logger_module.stack
+    def slow_stack(*args):
+        # Finding the caller is the slow part of logging
+        counter.advance(7)
+        return stack(*args)
+
+    monkeypatch.setattr(logger_module, "stack", slow_stack)
+
+    with profiler.site("a"):
+        logger.warning("Slow log")
+
+    [event] = [event for event in profiler.events if event["name"] == "logging"]
+    assert event["args"] == {"website": "a", "log_type": "WARNING"}
+    assert event["dur"] == 7000
+
+    profiler.config(enabled=False)
+    assert logger.timer is None
+
+
+def test_cprofile_scrapes_one_site_at_a_time_when_global(profiler, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler_module, "CPROFILE_IS_GLOBAL", True)
+    profiler.config(enabled=True, cprofile=True, output_dir=str(tmp_path))
+
+    with profiler.site("a"):
+        assert profiler.cprofile_lock.locked()
+    assert not profiler.cprofile_lock.locked()
+    assert "a" in profiler.site_profiles
+
+    # Without cProfile the sites are not serialised
+    profiler.config(enabled=True, output_dir=str(tmp_path))
+    with profiler.site("a"):
+        assert not profiler.cprofile_lock.locked()
+
+
+def test_write_output(profiler, tmp_path):
+    profiler.config(enabled=True, cprofile=True, output_dir=str(tmp_path))
+    with profiler.site("a"), profiler.span("BeautifulSoup"):
+        pass
+
+    profiler.write()
+
+    trace = json.loads((tmp_path / "trace.json").read_text())
+    assert {event["name"] for event in trace["traceEvents"]} == {"a", "BeautifulSoup"}
+    for event in trace["traceEvents"]:
+        assert event["ph"] == "X"
+        assert {"ts", "dur", "pid", "tid", "cat", "args"} <= event.keys()
+
+    summary = json.loads((tmp_path / "summary.json").read_text())
+    assert summary["a"]["stages"][0]["name"] == "BeautifulSoup"
+    assert (tmp_path / "a.prof").exists()
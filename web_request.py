@@ -1,7 +1,4 @@
 from python_logging.logger import logger
-from fake_headers import Headers
-
-import playwright
 
 
 # Request limitations
@@ -21,6 +18,8 @@ async def playwright_fetch(url, page, xpath):
     """
     Uses playwright to open up a webpage and get the html
     """
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
     try:
         # Remove all unnecessary content from the request 
         await page.route("**/*", intercept_request)
@@ -46,7 +45,7 @@ async def playwright_fetch(url, page, xpath):
             # If it's not a good response, return the check result
             return response_check
 
-    except playwright.async_api.TimeoutError:
+    except PlaywrightTimeoutError:
         pass
 
     except Exception as error:
@@ -66,6 +65,8 @@ def headers():
     """
     Generate random headers
     """
+    from fake_headers import Headers
+
     header = Headers(headers=True)
 
     return header.generate()